@@ -1,95 +1,256 @@
+import heapq
 import mido
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from pathlib import Path
+from typing import NamedTuple
 
 
-def ticks_to_lrc_time(ticks, ticks_per_beat, tempo=500000):
-    """Konvertiert MIDI-Ticks in LRC-Zeitformat [mm:ss.xx]"""
-    seconds = mido.tick2second(ticks, ticks_per_beat, tempo)
-    minutes = int(seconds // 60)
-    secs = seconds % 60
-    return f"[{minutes:02d}:{secs:05.2f}]"
+DEFAULT_TEMPO = 500000  # 120 BPM
+LINE_BREAKS = frozenset('\r\n')
+SKIP_PREFIXES = ('---', '(c)')  # Platzhalter und Copyright-Hinweise
+MIDI_SUFFIXES = ('.mid', '.midi')
+
+_by_tick = itemgetter(0)
+_TWO_DIGITS = tuple(f"{i:02d}" for i in range(100))
+_BREAKS_TO_SPACES = str.maketrans('\r\n', '  ')
+
+
+class TempoLookup(NamedTuple):
+    """Tempo-Abschnitte als parallele Listen: Start-Tick, kumulierte Sekunden, Sekunden pro Tick"""
+    ticks: list
+    cum_seconds: list
+    sec_per_tick: list
+
+
+def _scan_track(track, collect_lyrics=True):
+    """Liefert Tempo-Änderungen [(tick, tempo), ...] und gefilterte Lyrics [(tick, text), ...] eines Tracks"""
+    tempos = []
+    lyrics = []
+    abs_tick = 0
+    for msg in track:
+        abs_tick += msg.time
+        msg_type = msg.type
+        if msg_type == 'set_tempo':
+            tempos.append((abs_tick, msg.tempo))
+        elif msg_type == 'lyrics' and collect_lyrics:
+            text = msg.text
+            # Platzhalter und Metadaten gar nicht erst übernehmen
+            if not (text.startswith(SKIP_PREFIXES) or ':' in text):
+                lyrics.append((abs_tick, text))
+    return tempos, lyrics
+
+
+def scan_tracks(midi):
+    """Baut in einem Durchlauf über alle Tracks die Tempo-Map und sammelt die Lyrics"""
+    per_track = []
+    lyrics = None
+    for track in midi.tracks:
+        tempos, track_lyrics = _scan_track(track, collect_lyrics=lyrics is None)
+        per_track.append(tempos)
+        # Erster Track mit echten Lyrics (typischerweise "SysEx-Daten")
+        if track_lyrics:
+            lyrics = track_lyrics
+
+    # Die Tracks sind bereits sortiert, daher reicht ein Merge statt eines Sorts.
+    # Bei mehreren Tempi auf demselben Tick gewinnt das letzte.
+    tempo_by_tick = {0: DEFAULT_TEMPO}
+    for tick, tempo in heapq.merge(*per_track, key=_by_tick):
+        tempo_by_tick[tick] = tempo
+    return list(tempo_by_tick.items()), lyrics
+
+
+def _prepare_tempo_lookup(tempo_map, ticks_per_beat):
+    """Berechnet einmalig Tick-Grenzen, kumulierte Sekunden und Sekunden pro Tick je Tempo-Abschnitt"""
+    inv_tpb = 1.0 / ticks_per_beat
+    tempo_ticks = []
+    cum_seconds = []
+    sec_per_tick = []
+    seconds = 0.0
+    for tick, tempo in tempo_map:
+        if sec_per_tick:
+            seconds += (tick - tempo_ticks[-1]) * sec_per_tick[-1]
+        tempo_ticks.append(tick)
+        cum_seconds.append(seconds)
+        sec_per_tick.append(tempo / 1_000_000.0 * inv_tpb)
+    return TempoLookup(tempo_ticks, cum_seconds, sec_per_tick)
+
+
+def ticks_to_seconds_vec(ticks, tempo_lookup):
+    """Konvertiert aufsteigend sortierte Ticks in einem einzigen Durchlauf über die Tempo-Abschnitte in Sekunden"""
+    tempo_ticks, cum_seconds, sec_per_tick = tempo_lookup
+    last_idx = len(tempo_ticks) - 1
+    idx = 0
+    # Werte des aktuellen Abschnitts als Locals halten, nur beim Abschnittswechsel neu laden
+    seg_tick, seg_seconds, seg_sec_per_tick = tempo_ticks[0], cum_seconds[0], sec_per_tick[0]
+    next_tick = tempo_ticks[1] if last_idx else None
+    seconds = []
+    append = seconds.append
+    for tick in ticks:
+        if next_tick is not None and next_tick <= tick:
+            while idx < last_idx and tempo_ticks[idx + 1] <= tick:
+                idx += 1
+            seg_tick, seg_seconds, seg_sec_per_tick = tempo_ticks[idx], cum_seconds[idx], sec_per_tick[idx]
+            next_tick = tempo_ticks[idx + 1] if idx < last_idx else None
+        append(seg_seconds + (tick - seg_tick) * seg_sec_per_tick)
+    return seconds
+
+
+def format_lrc_time(seconds):
+    """Formatiert Sekunden als LRC-Zeitstempel [mm:ss.xx]"""
+    # In ganzen Hundertstelsekunden rechnen, damit z.B. 59.996s nicht zu [00:60.00] wird
+    centiseconds = int(seconds * 100 + 0.5)
+    minutes, rest = divmod(centiseconds, 6000)
+    secs, hundredths = divmod(rest, 100)
+    minutes_str = _TWO_DIGITS[minutes] if minutes < 100 else str(minutes)
+    return "".join(("[", minutes_str, ":", _TWO_DIGITS[secs], ".", _TWO_DIGITS[hundredths], "]"))
 
 
 def midi_to_lrc(input_file, output_file):
-    """Konvertiert MIDI-Lyrics zu LRC-Format"""
+    """Konvertiert MIDI-Lyrics zu LRC-Format, gibt zurück ob eine LRC-Datei geschrieben wurde"""
     midi = mido.MidiFile(input_file)
-    lrc_lines = []
     
-    # Finde den Lyrics-Track (typischerweise "SysEx-Daten")
-    lyrics_track = None
-    for track in midi.tracks:
-        for msg in track:
-            if msg.type == 'lyrics':
-                lyrics_track = track
-                break
-        if lyrics_track:
-            break
+    # Tempo-Map und Lyrics (typischerweise aus "SysEx-Daten") in einem Durchlauf bestimmen
+    tempo_map, lyrics = scan_tracks(midi)
     
-    if not lyrics_track:
-        print("Keine Lyrics im MIDI-File gefunden!")
-        return
+    if not lyrics:
+        print(f"Keine Lyrics in {input_file} gefunden!")
+        return False
     
-    # Finde Tempo-Events für korrekte Zeitberechnung
-    tempo = 500000  # Default: 120 BPM
-    for track in midi.tracks:
-        for msg in track:
-            if msg.type == 'set_tempo':
-                tempo = msg.tempo
-                break
+    tempo_lookup = _prepare_tempo_lookup(tempo_map, midi.ticks_per_beat)
+    
+    # Ab hier werden nur noch Tempo-Lookup und Lyrics gebraucht; die übrigen
+    # Message-Objekte (Noten usw.) können vor dem Zusammensetzen freigegeben werden
+    del midi
     
     # Verarbeite Lyrics
-    abs_time = 0
-    current_line = ""
+    # Es gibt höchstens so viele Zeilen wie Lyrics-Events, daher vorab allokieren
+    line_ticks = [0] * len(lyrics)
+    line_texts = [None] * len(lyrics)
+    line_count = 0
+    line_parts = []
     line_start_time = None
     
-    for msg in lyrics_track:
-        abs_time += msg.time
-        
-        if msg.type == 'lyrics':
-            text = msg.text
-            
-            # Überspringe Platzhalter und Metadaten
-            if text.startswith('---') or text.startswith('(c)') or ':' in text:
-                continue
-            
-            # Zeilenumbruch erkannt
-            if text == '\r' or text.endswith('\r'):
-                if text != '\r':
-                    # Text vor dem \r hinzufügen
-                    if line_start_time is None:
-                        line_start_time = abs_time
-                    current_line += text.rstrip('\r').rstrip()
-                
-                # Zeile speichern, wenn Inhalt vorhanden
-                if current_line.strip():
-                    timecode = ticks_to_lrc_time(line_start_time, midi.ticks_per_beat, tempo)
-                    lrc_lines.append(f"{timecode} {current_line.strip()}")
-                
-                current_line = ""
-                line_start_time = None
-            else:
-                # Startzeit der Zeile merken
+    for abs_time, text in lyrics:
+        # Zeilenumbruch erkannt (\r oder \n, wie in der Web-App)
+        if text[-1:] in LINE_BREAKS:
+            # rstrip() entfernt \r/\n zusammen mit restlichem Whitespace in einem Schritt
+            line_text = text.rstrip()
+            if line_text:
+                # Text vor dem Umbruch hinzufügen
                 if line_start_time is None:
                     line_start_time = abs_time
-                
-                # Silbe/Wort hinzufügen
-                current_line += text
+                line_parts.append(line_text)
+            
+            # Zeile merken, wenn Inhalt vorhanden (Zeit wird später gesammelt umgerechnet).
+            # Eingebettete \r/\n würden den LRC-Eintrag zerreißen, daher durch Leerzeichen ersetzen.
+            current_line = ''.join(line_parts).translate(_BREAKS_TO_SPACES).strip()
+            if current_line:
+                line_ticks[line_count] = line_start_time
+                line_texts[line_count] = current_line
+                line_count += 1
+            
+            line_parts.clear()
+            line_start_time = None
+        else:
+            # Startzeit der Zeile merken
+            if line_start_time is None:
+                line_start_time = abs_time
+            
+            # Silbe/Wort hinzufügen
+            line_parts.append(text)
     
-    # Letzte Zeile (falls keine \r am Ende)
-    if current_line.strip():
-        timecode = ticks_to_lrc_time(line_start_time, midi.ticks_per_beat, tempo)
-        lrc_lines.append(f"{timecode} {current_line.strip()}")
+    # Letzte Zeile (falls kein Umbruch am Ende)
+    current_line = ''.join(line_parts).translate(_BREAKS_TO_SPACES).strip()
+    if current_line:
+        line_ticks[line_count] = line_start_time
+        line_texts[line_count] = current_line
+        line_count += 1
+    del line_ticks[line_count:]
+    del line_texts[line_count:]
     
-    # LRC-Datei schreiben
+    # Alle Zeilen-Ticks in einem Durchlauf in Sekunden umrechnen
+    line_seconds = ticks_to_seconds_vec(line_ticks, tempo_lookup)
+    lrc_lines = [
+        f"{format_lrc_time(seconds)} {text}\n"
+        for seconds, text in zip(line_seconds, line_texts)
+    ]
+    
+    # LRC-Datei in einem Rutsch schreiben
     with open(output_file, 'w', encoding='utf-8') as f:
-        for line in lrc_lines:
-            f.write(line + '\n')
+        f.write(''.join(lrc_lines))
     
     print(f"Erfolgreich {len(lrc_lines)} Zeilen nach {output_file} geschrieben.")
+    return True
+
+
+def _convert_file(input_file, output_file):
+    """Worker für den Ordner-Modus: konvertiert eine Datei und meldet Fehler, statt abzubrechen"""
+    try:
+        # False, wenn keine Lyrics gefunden wurden (Meldung mit Dateiname kommt von midi_to_lrc)
+        return midi_to_lrc(input_file, output_file)
+    except Exception as e:
+        print(f"Fehler bei {input_file}: {type(e).__name__}: {e}")
+        return False
+
+
+def midi_dir_to_lrc(input_dir, output_dir):
+    """Konvertiert alle MIDI-Dateien eines Ordners parallel zu LRC-Dateien, gibt die Anzahl der Fehler zurück"""
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    # MIDI-Dateien nach Ziel-LRC gruppieren; z.B. song.mid und song.midi würden dieselbe Datei schreiben
+    by_target = {}
+    for midi_path in sorted(input_dir.iterdir()):
+        if midi_path.suffix.lower() in MIDI_SUFFIXES:
+            by_target.setdefault(midi_path.stem, []).append(midi_path)
+    
+    failed = 0
+    input_files = []
+    output_files = []
+    for midi_paths in by_target.values():
+        if len(midi_paths) > 1:
+            names = ', '.join(path.name for path in midi_paths)
+            print(f"Übersprungen, gleiche Ziel-LRC-Datei: {names}")
+            failed += len(midi_paths)
+            continue
+        midi_path = midi_paths[0]
+        lrc_path = output_dir / (midi_path.stem + '.lrc')
+        # LRC-Dateien, die neuer als die MIDI-Datei sind, überspringen
+        if lrc_path.exists() and lrc_path.stat().st_mtime >= midi_path.stat().st_mtime:
+            continue
+        input_files.append(str(midi_path))
+        output_files.append(str(lrc_path))
+    
+    if not input_files and not failed:
+        print(f"Keine neuen MIDI-Dateien in {input_dir} gefunden.")
+        return 0
+    
+    if input_files:
+        # Jede Datei ist unabhängig, daher auf alle CPU-Kerne verteilen
+        with ProcessPoolExecutor() as executor:
+            results = list(executor.map(_convert_file, input_files, output_files))
+        failed += results.count(False)
+    
+    if failed:
+        print(f"{failed} Datei(en) konnten nicht konvertiert werden.")
+    return failed
 
 
 if __name__ == '__main__':
     if len(sys.argv) != 3:
         print('Usage: python midi2lrc.py <input_file.mid> <output_file.lrc>')
+        print('       python midi2lrc.py <input_dir> <output_dir>')
         sys.exit(1)
-    midi_to_lrc(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    if Path(sys.argv[1]).is_dir():
+        output_dir = Path(sys.argv[2])
+        if output_dir.exists() and not output_dir.is_dir():
+            print(f"{output_dir} ist kein Ordner. Bei einem Eingabe-Ordner muss die Ausgabe ebenfalls ein Ordner sein.")
+            print('Usage: python midi2lrc.py <input_dir> <output_dir>')
+            sys.exit(1)
+        if midi_dir_to_lrc(sys.argv[1], sys.argv[2]):
+            sys.exit(1)
+    else:
+        midi_to_lrc(sys.argv[1], sys.argv[2])